@@ -1,52 +1,92 @@
 import redis
-import socket
+import asyncio
 import argparse
-import time
+import socket
+import struct
 import threading
-from tqdm import tqdm
+import uvloop
+from tqdm.asyncio import tqdm
 
 # Conversion factor for MB to bytes
 MB_TO_BYTES = 1048576
 
+def configure_socket(sock, so_rcvbuf, so_sndbuf, tcp_nodelay):
+    """Pin the socket buffers and Nagle behavior so the slow-client throttle is deterministic."""
+    if tcp_nodelay:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    if so_rcvbuf:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, so_rcvbuf)
+    if so_sndbuf:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, so_sndbuf)
+
 def populate_data(redis_host, redis_port, num_connections, initial_key_size, delta):
     pool = redis.ConnectionPool(host=redis_host, port=redis_port, max_connections=num_connections)
     client = redis.Redis(connection_pool=pool)
 
-    try:
-        for i in range(1, num_connections + 1):
+    # Allocate the largest value once and reuse slices of it; building a fresh
+    # multi-MB string per key doubles peak RSS once redis-py copies it into the
+    # RESP request.
+    max_size = (initial_key_size + (num_connections - 1) * delta) * MB_TO_BYTES
+    buf = b"x" * max_size
+
+    def worker(indices):
+        for i in indices:
             key = f"key_{i}"
             value_size = (initial_key_size + (i - 1) * delta) * MB_TO_BYTES
-            value = "x" * value_size
-            client.set(key, value)
+            client.set(key, memoryview(buf)[:value_size])
             print(f"Set key: {key} with size: {value_size} bytes")
+
+    try:
+        # Fan the SETs out over the pool instead of serializing them on one
+        # connection; interleaved shards balance the growing value sizes.
+        num_threads = min(num_connections, 8)
+        threads = []
+        for t in range(num_threads):
+            thread = threading.Thread(target=worker, args=(range(t + 1, num_connections + 1, num_threads),))
+            threads.append(thread)
+            thread.start()
+        for thread in threads:
+            thread.join()
     finally:
         pool.disconnect()
         print("All connections closed after populating data.")
 
-def fetch_data_slowly(redis_host, redis_port, num_connections, sleep_time):
-    def handle_connection(index):
+async def handle_connection(index, redis_host, redis_port, sleep_time, so_rcvbuf, so_sndbuf, tcp_nodelay):
+    try:
+        reader, writer = await asyncio.open_connection(redis_host, redis_port)
         try:
-            with socket.create_connection((redis_host, redis_port)) as s:
-                key = f"key_{index}\r\n"
-                command = f"GET {key}".encode('utf-8')
-                s.sendall(command)
-
-                # Use tqdm to show the sleep progress
-                for _ in tqdm(range(int(sleep_time * 10)), desc=f"Sleeping for key_{index}", leave=False):
-                    time.sleep(0.1)
+            sock = writer.get_extra_info('socket')
+            if sock is not None:
+                configure_socket(sock, so_rcvbuf, so_sndbuf, tcp_nodelay)
+            key = f"key_{index}\r\n"
+            command = f"GET {key}".encode('utf-8')
+            writer.write(command)
+            await writer.drain()
 
-                print(f"Sent GET command for: {key.strip()} but reading response very slowly or not at all.")
-        except Exception as e:
-            print(f"Error with connection {index}: {e}")
+            # A single sleep instead of a 0.1s progress loop: no 10 wakeups/sec
+            # per connection just to repaint a bar.
+            await asyncio.sleep(sleep_time)
 
-    threads = []
-    for i in range(1, num_connections + 1):
-        thread = threading.Thread(target=handle_connection, args=(i,))
-        threads.append(thread)
-        thread.start()
+            print(f"Sent GET command for: {key.strip()} but reading response very slowly or not at all.")
+        finally:
+            # Linger=0 turns close() into an RST so the 4-tuple is freed
+            # immediately instead of sitting 60s in TIME_WAIT; rapid reruns
+            # would otherwise exhaust the ephemeral port range.
+            if sock is not None:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+            writer.close()
+    except Exception as e:
+        print(f"Error with connection {index}: {e}")
 
-    for thread in threads:
-        thread.join()
+async def fetch_data_slowly(redis_host, redis_port, num_connections, sleep_time, so_rcvbuf, so_sndbuf, tcp_nodelay, use_tqdm=True):
+    # All slow connections are coroutines on one event loop instead of one OS thread each.
+    connections = [handle_connection(i, redis_host, redis_port, sleep_time, so_rcvbuf, so_sndbuf, tcp_nodelay)
+                   for i in range(1, num_connections + 1)]
+    if use_tqdm:
+        # One aggregate bar over all connections instead of one bar per connection
+        await tqdm.gather(*connections, desc="Slow connections")
+    else:
+        await asyncio.gather(*connections)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Populate and fetch data from Redis using sockets.")
@@ -57,6 +97,10 @@ if __name__ == "__main__":
     parser.add_argument("--delta", type=int, required=True, help="Delta to increase key size in MB.")
     parser.add_argument("--sleep_time", type=float, required=True, help="Time to sleep between sending commands in the fetch stage.")
     parser.add_argument("--noflush", action="store_true", help="Do not flush the Redis database before starting.")
+    parser.add_argument("--so_rcvbuf", type=int, default=4096, help="SO_RCVBUF size in bytes for the slow sockets (0 keeps the kernel default).")
+    parser.add_argument("--so_sndbuf", type=int, default=65536, help="SO_SNDBUF size in bytes for the slow sockets (0 keeps the kernel default).")
+    parser.add_argument("--tcp_nodelay", type=int, default=1, help="Set TCP_NODELAY on the slow sockets (1 to enable, 0 to disable).")
+    parser.add_argument("--no_tqdm", action="store_true", help="Disable the tqdm progress bar during the fetch stage.")
 
     args = parser.parse_args()
 
@@ -69,4 +113,9 @@ if __name__ == "__main__":
     populate_data(args.redis_host, args.redis_port, args.num_connections, args.initial_key_size, args.delta)
 
     print("Starting fetch stage...")
-    fetch_data_slowly(args.redis_host, args.redis_port, args.num_connections, args.sleep_time)
+    # Resolve the host once; thousands of per-connection getaddrinfo calls are a
+    # well-known cause of connect-storm latency spikes.
+    fetch_host = socket.getaddrinfo(args.redis_host, args.redis_port, socket.AF_INET, socket.SOCK_STREAM)[0][4][0]
+    uvloop.install()
+    asyncio.run(fetch_data_slowly(fetch_host, args.redis_port, args.num_connections, args.sleep_time,
+                                  args.so_rcvbuf, args.so_sndbuf, args.tcp_nodelay, not args.no_tqdm))
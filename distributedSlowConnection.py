@@ -1,12 +1,15 @@
 import redis
+import redis.asyncio as aredis
+import asyncio
 import threading
-import time
 import random
-import string
+import os
 import argparse
 import socket
-from tqdm import tqdm
+import struct
 from redis.connection import ConnectionPool
+from redis._parsers import _AsyncHiredisParser
+from redis.utils import HIREDIS_AVAILABLE
 
 # Parse input arguments
 def parse_args():
@@ -23,13 +26,51 @@ def parse_args():
     parser.add_argument('--recv_sleep_time', type=float, default=1.0, help='Sleep time between socket recv operations in seconds')
     parser.add_argument('--hash_fields', type=int, default=1000000, help='Number of fields in the large hash')
     parser.add_argument('--hash_field_size', type=int, default=100, help='Size of each field value in the large hash in bytes')
+    parser.add_argument('--so_rcvbuf', type=int, default=0, help='SO_RCVBUF size in bytes for the slow sockets (0 derives 2x the recv chunk size)')
+    parser.add_argument('--so_sndbuf', type=int, default=65536, help='SO_SNDBUF size in bytes for the slow sockets (0 keeps the kernel default)')
+    parser.add_argument('--tcp_nodelay', type=int, default=1, help='Set TCP_NODELAY on the slow sockets (1 to enable, 0 to disable)')
+    parser.add_argument('--batch_size', type=int, default=64, help='Number of keys fetched per MGET in the read workers')
+    parser.add_argument('--connect_concurrency', type=int, default=512, help='Maximum in-flight connect() calls for the slow connections')
+    parser.add_argument('--server_side_populate', action='store_true', help='Populate the large hash with a server-side Lua script (no field bytes on the wire)')
     return parser.parse_args()
 
-# Generate random data of specified size
+# Generate random data of specified size; os.urandom fills the buffer in a
+# single C call instead of one Python-level random draw per byte
 def generate_data(size):
-    return ''.join(random.choices(string.ascii_letters + string.digits, k=size))
+    return os.urandom(size)
 
-def populate_db(pool, keys_count, data_size, hash_fields, hash_field_size, connections):
+# BDP-sized socket buffers for the fast read workers; the kernel defaults
+# (~85KB rcv / 16KB snd) stall the TCP window on high-bandwidth links
+FAST_SO_BUF = 16 << 20
+
+# HGETALL large-hash pre-encoded as multi-bulk RESP; inline commands take a
+# slower parser branch in redis-server, and baking the bytes at module load
+# removes the per-connection encode
+_HGETALL_CMD = b"*2\r\n$7\r\nHGETALL\r\n$10\r\nlarge-hash\r\n"
+
+class TunedConnection(aredis.Connection):
+    """redis.asyncio connection with enlarged SO_RCVBUF/SO_SNDBUF."""
+
+    async def _connect(self):
+        await super()._connect()
+        sock = self._writer.transport.get_extra_info('socket')
+        if sock is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, FAST_SO_BUF)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, FAST_SO_BUF)
+
+# Generates hash fields inside the Redis server; only the chunk boundaries
+# cross the wire instead of hash_fields * hash_field_size payload bytes
+POPULATE_HASH_LUA = """
+local start_i = tonumber(ARGV[1])
+local end_i = tonumber(ARGV[2])
+local value = string.rep('x', tonumber(ARGV[3]))
+for i = start_i, end_i - 1 do
+    redis.call('HSET', KEYS[1], 'field-' .. i, value)
+end
+return end_i - start_i
+"""
+
+def populate_db(pool, keys_count, data_size, hash_fields, hash_field_size, connections, server_side_populate=False):
     """Flush the database and populate it with a specified number of keys and a large hash."""
     client = redis.Redis(connection_pool=pool)
 
@@ -39,21 +80,52 @@ def populate_db(pool, keys_count, data_size, hash_fields, hash_field_size, conne
 
     value = generate_data(data_size)
 
-    for i in range(keys_count):
-        key = f"key-{i}"
-        client.set(key, value)
+    # Pipeline the SETs so population is bound by bandwidth, not per-command RTT
+    with client.pipeline(transaction=False) as pipe:
+        for i in range(keys_count):
+            pipe.set(f"key-{i}", value)
+            if (i + 1) % 1000 == 0:
+                pipe.execute()
+        pipe.execute()
 
     print(f"Populated DB with {keys_count} keys.")
 
     # Add a large hash with configurable fields and field size
     hash_key = "large-hash"
+    hset_batch = 1000
+    pipeline_flush = 50
+
+    populate_hash = client.register_script(POPULATE_HASH_LUA)
+
+    def server_side_worker(field_start, field_end):
+        # Run the field loop inside the server in chunks; chunking keeps each
+        # EVAL short enough not to stall the server's event loop.
+        for start in range(field_start, field_end, 10000):
+            end = min(start + 10000, field_end)
+            populate_hash(keys=[hash_key], args=[start, end, hash_field_size])
 
     def worker(field_start, field_end):
-        local_client = redis.Redis(connection_pool=pool)
-        for i in range(field_start, field_end):
-            field = f"field-{i}"
-            field_value = generate_data(hash_field_size)
-            local_client.hset(hash_key, field, field_value)
+        if server_side_populate:
+            server_side_worker(field_start, field_end)
+            return
+        # The shared client wraps the pool and is thread-safe; each worker only
+        # needs its own pipeline. Variadic HSET (mapping form) amortizes RTT and
+        # RESP encoding over 1000x fewer round-trips than one HSET per field.
+        with client.pipeline(transaction=False) as pipe:
+            mapping = {}
+            batches_pending = 0
+            for i in range(field_start, field_end):
+                mapping[f"field-{i}"] = generate_data(hash_field_size)
+                if len(mapping) >= hset_batch:
+                    pipe.hset(hash_key, mapping=mapping)
+                    mapping = {}
+                    batches_pending += 1
+                    if batches_pending >= pipeline_flush:
+                        pipe.execute()
+                        batches_pending = 0
+            if mapping:
+                pipe.hset(hash_key, mapping=mapping)
+            pipe.execute()
 
     # Create threads to populate the hash in parallel
     threads = []
@@ -70,59 +142,102 @@ def populate_db(pool, keys_count, data_size, hash_fields, hash_field_size, conne
 
     print(f"Populated DB with large hash: {hash_key}, containing {hash_fields} fields (~{(hash_fields * hash_field_size) / (1024 * 1024):.2f} MB).")
 
-def slow_reader(client_id, host, port, recv_chunk_size_min, recv_chunk_size_max, recv_sleep_time, slow_connections):
-    """Simulate a slow connection using raw sockets that performs HGETALL on a large hash."""
+async def slow_reader(client_id, host, port, recv_chunk_size_min, recv_chunk_size_max, recv_sleep_time, slow_connections,
+                      so_rcvbuf, so_sndbuf, tcp_nodelay, connect_sem):
+    """Simulate a slow connection using a raw non-blocking socket that performs HGETALL on a large hash."""
+    loop = asyncio.get_running_loop()
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     try:
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-            sock.connect((host, port))
-            command = "HGETALL large-hash\r\n"
-            sock.sendall(command.encode())
-
-            # Calculate dynamic chunk size for this client
-            recv_chunk_size = recv_chunk_size_min + (client_id * ((recv_chunk_size_max - recv_chunk_size_min) // (slow_connections or 1)))
-
-            # Read response in calculated chunks
-            while True:
-                chunk = sock.recv(recv_chunk_size)
-                if not chunk:
-                    break
-                time.sleep(recv_sleep_time)  # Delay to simulate slowness
+        # Calculate dynamic chunk size for this client
+        recv_chunk_size = recv_chunk_size_min + (client_id * ((recv_chunk_size_max - recv_chunk_size_min) // (slow_connections or 1)))
+
+        # Pin the socket buffers before connect so the slow-client throttle is
+        # bounded by the script's knobs rather than kernel autotuning.
+        if tcp_nodelay:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, so_rcvbuf or recv_chunk_size * 2)
+        if so_sndbuf:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, so_sndbuf)
+        sock.setblocking(False)
+
+        # The semaphore bounds in-flight connects so a burst of tens of
+        # thousands of SYNs stays within the server's listen backlog (raise
+        # net.core.somaxconn / net.ipv4.tcp_max_syn_backlog accordingly).
+        async with connect_sem:
+            await loop.sock_connect(sock, (host, port))
+
+        await loop.sock_sendall(sock, _HGETALL_CMD)
+
+        # Read response in calculated chunks into one reused buffer; the bytes
+        # are discarded anyway, so there is no reason to allocate per chunk.
+        buf = bytearray(recv_chunk_size)
+        mv = memoryview(buf)
+        while True:
+            n = await loop.sock_recv_into(sock, mv)
+            if not n:
+                break
+            await asyncio.sleep(recv_sleep_time)  # Delay to simulate slowness
     except Exception as e:
         print(f"Slow Client {client_id} encountered an error: {e}")
+    finally:
+        # Linger=0 turns close() into an RST so the 4-tuple is freed immediately
+        # instead of sitting 60s in TIME_WAIT; rapid reruns with tens of
+        # thousands of connections would otherwise exhaust the ephemeral port
+        # range (see also sysctl net.ipv4.ip_local_port_range).
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+        except OSError:
+            pass
+        sock.close()
+
+async def read_db(host, port, keys, worker_count, batch_size):
+    """Perform read operations on the keys with N coroutines sharing one connection pool."""
+    # Ask for the C hiredis parser explicitly so a missing hiredis install shows
+    # up as a pure-Python fallback message instead of a silent 5-10x parse slowdown
+    parser_kwargs = {'parser_class': _AsyncHiredisParser} if HIREDIS_AVAILABLE else {}
+    if not HIREDIS_AVAILABLE:
+        print("hiredis not installed; falling back to the pure-Python RESP parser")
+    pool = aredis.ConnectionPool(host=host, port=port, max_connections=worker_count,
+                                 connection_class=TunedConnection, **parser_kwargs)
+    # One plain int per coroutine; the reporter sums them, so no lock is needed.
+    counters = [0] * worker_count
+    batch_size = min(batch_size, len(keys))
+    # One client for all workers; it wraps the shared pool and is safe to share,
+    # so there is no per-worker construction and parser state.
+    client = aredis.Redis(connection_pool=pool)
 
-def read_db(pool, keys, metrics):
-    """Perform read operations on the keys."""
-    def worker(client_id, metrics, pool, keys):
-        client = redis.Redis(connection_pool=pool)
+    async def worker(client_id):
+        # Private PRNG per worker: no contention on the module-level random state,
+        # and the bound method skips the module attribute lookup in the hot loop
+        sample = random.Random(client_id).sample
         while True:
             try:
-                key = random.choice(keys)
-                client.get(key)
-
-                with metrics["lock"]:
-                    metrics["ops"] += 1
+                # One MGET per batch instead of one GET round-trip per key
+                batch = sample(keys, batch_size)
+                await client.mget(batch)
+                counters[client_id] += batch_size
             except redis.ConnectionError as e:
                 print(f"Client {client_id} encountered connection error: {e}")
                 break
 
-    threads = []
-    for i in range(metrics["worker_count"]):
-        thread = threading.Thread(target=worker, args=(i, metrics, pool, keys))
-        thread.daemon = True
-        threads.append(thread)
-        thread.start()
+    async def reporter():
+        # Counters grow monotonically and the reporter diffs two snapshots, so
+        # increments racing a reset are never lost.
+        prev_total = 0
+        while True:
+            await asyncio.sleep(1)
+            total = sum(counters)
+            print(f"Throughput: {total - prev_total} ops/sec")
+            prev_total = total
 
+    tasks = [asyncio.create_task(worker(i)) for i in range(worker_count)]
+    tasks.append(asyncio.create_task(reporter()))
     try:
-        while True:
-            time.sleep(1)
-            with metrics["lock"]:
-                ops = metrics["ops"]
-                print(f"Throughput: {ops} ops/sec")
-                metrics["ops"] = 0
-    except KeyboardInterrupt:
-        print("Shutting down...")
-        for thread in threads:
-            thread.join()
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await pool.disconnect()
 
 def main():
     args = parse_args()
@@ -130,21 +245,37 @@ def main():
 
     # Stage 1: Populate DB
     if not args.skip_population:
-        populate_db(pool, args.keys_count, args.data_size, args.hash_fields, args.hash_field_size, args.connections)
+        populate_db(pool, args.keys_count, args.data_size, args.hash_fields, args.hash_field_size, args.connections,
+                    args.server_side_populate)
 
     # Stage 2: Perform Reads
-    keys = [f"key-{i}" for i in range(args.keys_count)]
-    metrics = {"ops": 0, "lock": threading.Lock(), "worker_count": args.connections}
-
-    # Start slow connections with varying recv_chunk_size
-    for i in tqdm (range(args.slow_connections), desc="Estblished Connections…"):
-        thread = threading.Thread(target=slow_reader, args=(i, args.host, args.port, args.recv_chunk_size_min, args.recv_chunk_size_max, args.recv_sleep_time, args.slow_connections))
-        thread.daemon = True
-        if args.slow_connections > 1000:
-            time.sleep(0.01)  # Add delay if the number of slow connections is above 1000
-        thread.start()
+    # Pre-encoded key names save redis-py a str->bytes encode on every command
+    keys = [f"key-{i}".encode() for i in range(args.keys_count)]
+
+    # Resolve the host once; thousands of per-connection getaddrinfo calls are a
+    # well-known cause of connect-storm latency spikes.
+    slow_host = socket.getaddrinfo(args.host, args.port, socket.AF_INET, socket.SOCK_STREAM)[0][4][0]
+
+    async def run_reads():
+        # Start slow connections with varying recv_chunk_size; all of them
+        # dispatch their connect() in parallel, rate-limited by the semaphore.
+        connect_sem = asyncio.Semaphore(args.connect_concurrency)
+        slow_tasks = [
+            asyncio.create_task(slow_reader(i, slow_host, args.port, args.recv_chunk_size_min, args.recv_chunk_size_max,
+                                            args.recv_sleep_time, args.slow_connections,
+                                            args.so_rcvbuf, args.so_sndbuf, args.tcp_nodelay, connect_sem))
+            for i in range(args.slow_connections)
+        ]
+        try:
+            await read_db(args.host, args.port, keys, args.connections, args.batch_size)
+        finally:
+            for task in slow_tasks:
+                task.cancel()
 
-    read_db(pool, keys, metrics)
+    try:
+        asyncio.run(run_reads())
+    except KeyboardInterrupt:
+        print("Shutting down...")
 
 if __name__ == "__main__":
     main()
@@ -2,10 +2,16 @@ import redis
 import threading
 import time
 import random
-import string
+import os
+import numpy as np
 import argparse
 import socket
-from redis.connection import ConnectionPool
+import struct
+import selectors
+import heapq
+from redis.connection import Connection, ConnectionPool
+from redis._parsers import _HiredisParser
+from redis.utils import HIREDIS_AVAILABLE
 
 # Parse input arguments
 def parse_args():
@@ -21,78 +27,215 @@ def parse_args():
     parser.add_argument('--recv_sleep_time', type=float, default=1.0, help='Sleep time between socket recv operations in seconds')
     parser.add_argument('--hash_fields', type=int, default=1000000, help='Number of fields in the large hash')
     parser.add_argument('--hash_field_size', type=int, default=100, help='Size of each field value in the large hash in bytes')
+    parser.add_argument('--so_rcvbuf', type=int, default=0, help='SO_RCVBUF size in bytes for the slow sockets (0 derives 2x the recv chunk size)')
+    parser.add_argument('--so_sndbuf', type=int, default=65536, help='SO_SNDBUF size in bytes for the slow sockets (0 keeps the kernel default)')
+    parser.add_argument('--tcp_nodelay', type=int, default=1, help='Set TCP_NODELAY on the slow sockets (1 to enable, 0 to disable)')
+    parser.add_argument('--pipeline_depth', type=int, default=1, help='Number of GETs per pipeline in the read workers (1 sends each GET on its own round trip)')
     return parser.parse_args()
 
-# Generate random data of specified size
+# Generate random data of specified size; os.urandom fills the buffer in a
+# single C call instead of one Python-level random draw per byte
 def generate_data(size):
-    return ''.join(random.choices(string.ascii_letters + string.digits, k=size))
+    return os.urandom(size)
+
+# BDP-sized socket buffers for the fast read workers; the kernel defaults
+# (~85KB rcv / 16KB snd) stall the TCP window on high-bandwidth links
+FAST_SO_BUF = 16 << 20
+
+# HGETALL large-hash pre-encoded as multi-bulk RESP; inline commands take a
+# slower parser branch in redis-server, and baking the bytes at module load
+# removes the per-connection encode
+_HGETALL_CMD = b"*2\r\n$7\r\nHGETALL\r\n$10\r\nlarge-hash\r\n"
+
+class TunedConnection(Connection):
+    """redis-py connection with enlarged SO_RCVBUF/SO_SNDBUF (TCP_NODELAY is already set upstream)."""
+
+    def _connect(self):
+        sock = super()._connect()
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, FAST_SO_BUF)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, FAST_SO_BUF)
+        return sock
 
 def populate_db(pool, keys_count, data_size, hash_fields, hash_field_size):
     """Populate the database with a specified number of keys and a large hash."""
     client = redis.Redis(connection_pool=pool)
     value = generate_data(data_size)
 
-    for i in range(keys_count):
-        key = f"key-{i}"
-        client.set(key, value)
+    # MSET in chunks of 1000 instead of one SET (and one RTT) per key; every
+    # key shares the same bytes object, so the chunk dict is cheap to build.
+    for start in range(0, keys_count, 1000):
+        client.mset({f"key-{i}": value for i in range(start, min(start + 1000, keys_count))})
 
     print(f"Populated DB with {keys_count} keys.")
 
-    # Add a large hash with configurable fields and field size
+    # Add a large hash with configurable fields and field size. One HSET per
+    # field pays a full RTT each; the mapping form carries 1000 fields per
+    # command and the pipeline flushes 50 commands per round trip.
     hash_key = "large-hash"
-    for i in range(hash_fields):
-        field = f"field-{i}"
-        field_value = generate_data(hash_field_size)
-        client.hset(hash_key, field, field_value)
+    hset_batch = 1000
+    pipe = client.pipeline(transaction=False)
+    pending = 0
+    for start in range(0, hash_fields, hset_batch):
+        mapping = {f"field-{i}": generate_data(hash_field_size)
+                   for i in range(start, min(start + hset_batch, hash_fields))}
+        pipe.hset(hash_key, mapping=mapping)
+        pending += 1
+        if pending >= 50:
+            pipe.execute()
+            pending = 0
+    if pending:
+        pipe.execute()
 
     print(f"Populated DB with large hash: {hash_key}, containing {hash_fields} fields (~{(hash_fields * hash_field_size) / (1024 * 1024):.2f} MB).")
 
-def slow_reader(client_id, host, port, recv_chunk_size, recv_sleep_time):
-    """Simulate a slow connection using raw sockets that performs HGETALL on a large hash."""
-    try:
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-            sock.connect((host, port))
-            command = "HGETALL large-hash\r\n"
-            sock.sendall(command.encode())
-
-            # Read response in small chunks
-            while True:
-                chunk = sock.recv(recv_chunk_size)  # Read in small chunks
-                if not chunk:
-                    break
-                time.sleep(recv_sleep_time)  # Delay to simulate slowness
-    except Exception as e:
-        print(f"Slow Client {client_id} encountered an error: {e}")
-
-def read_db(pool, keys, metrics):
+def run_slow_readers(slow_connections, host, port, recv_chunk_size, recv_sleep_time, so_rcvbuf, so_sndbuf, tcp_nodelay):
+    """Simulate all slow connections from one reactor thread.
+
+    Each connection performs HGETALL on the large hash over a non-blocking raw
+    socket; a selectors (epoll) loop plus a heap of (wake_time, fd) pairs
+    replaces one sleeping OS thread per connection. Sockets are unregistered
+    from the selector while their recv delay is pending, so the loop never
+    spins on readable-but-not-due connections.
+    """
+    sel = selectors.DefaultSelector()
+    # One receive buffer for the whole reactor: the data is discarded and the
+    # loop is single-threaded, so recv_into here avoids allocating a fresh
+    # bytes object per 64-byte chunk (millions of allocs for a 10MB hash)
+    recv_buf = bytearray(recv_chunk_size)
+    sockets = {}
+    wakeups = []  # heap of (time the fd may read its next chunk, fd)
+    # Resolve the host once instead of a getaddrinfo per connection
+    resolved = socket.getaddrinfo(host, port, socket.AF_INET, socket.SOCK_STREAM)[0][4]
+
+    def drop(sock, fd, registered):
+        if registered:
+            sel.unregister(sock)
+        # Linger=0 turns close() into an RST so the 4-tuple is freed immediately
+        # instead of sitting 60s in TIME_WAIT; rapid reruns with many slow
+        # connections would otherwise exhaust the ephemeral port range
+        # (see also sysctl net.ipv4.ip_local_port_range).
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+        except OSError:
+            pass
+        sock.close()
+        sockets.pop(fd, None)
+
+    for client_id in range(slow_connections):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        # Pin the socket buffers before connect so the slow-client throttle is
+        # bounded by the script's knobs rather than kernel autotuning.
+        if tcp_nodelay:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, so_rcvbuf or recv_chunk_size * 2)
+        if so_sndbuf:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, so_sndbuf)
+        sock.setblocking(False)
+        sock.connect_ex(resolved)
+        sel.register(sock, selectors.EVENT_WRITE, client_id)
+        sockets[sock.fileno()] = sock
+
+    while sockets:
+        now = time.monotonic()
+        # Re-register every connection whose recv delay has elapsed
+        while wakeups and wakeups[0][0] <= now:
+            _, fd, client_id = heapq.heappop(wakeups)
+            if fd in sockets:
+                sel.register(sockets[fd], selectors.EVENT_READ, client_id)
+
+        timeout = max(0.0, wakeups[0][0] - now) if wakeups else None
+        events = sel.select(timeout)
+        now = time.monotonic()
+
+        for key, mask in events:
+            sock = key.fileobj
+            client_id = key.data
+            fd = sock.fileno()
+            try:
+                if mask & selectors.EVENT_WRITE:
+                    err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                    if err:
+                        raise OSError(err, "connect failed")
+                    sock.send(_HGETALL_CMD)
+                    sel.modify(sock, selectors.EVENT_READ, client_id)
+                    continue
+
+                nbytes = sock.recv_into(recv_buf)  # Read in small chunks
+                if not nbytes:
+                    drop(sock, fd, registered=True)
+                    continue
+                # Park the connection until its next chunk is due
+                sel.unregister(sock)
+                heapq.heappush(wakeups, (now + recv_sleep_time, fd, client_id))
+            except (BlockingIOError, InterruptedError):
+                continue
+            except Exception as e:
+                print(f"Slow Client {client_id} encountered an error: {e}")
+                drop(sock, fd, registered=True)
+
+def read_db(pool, keys, worker_count, pipeline_depth=1):
     """Perform read operations on the keys."""
-    def worker(client_id, metrics, pool, keys):
-        client = redis.Redis(connection_pool=pool)
+    # One plain int per worker; list writes to distinct indices are GIL-atomic,
+    # so the reporter can sum them without a lock (torn reads are acceptable
+    # for a throughput gauge).
+    counters = [0] * worker_count
+    # One client for all workers; redis-py clients are thread-safe when wrapping
+    # a pool, so there is no per-thread construction and parser state.
+    client = redis.Redis(connection_pool=pool)
+
+    def worker(client_id, counters, client, keys):
+        # Private vectorized PRNG per thread: one C-level call yields 4096 key
+        # indices, where random.choice cost a Python-level draw per GET
+        rng = np.random.default_rng(client_id)
+        # Accumulate in a local int and flush to the shared slot in batches;
+        # a local increment is a plain fast-path STORE_FAST while the list
+        # write involves an index check and refcount traffic per op
+        local_ops = 0
+        keys_count = len(keys)
         while True:
             try:
-                key = random.choice(keys)
-                client.get(key)
-
-                with metrics["lock"]:
-                    metrics["ops"] += 1
+                idxs = rng.integers(0, keys_count, 4096)
+                if pipeline_depth > 1:
+                    # One round trip carries pipeline_depth GETs; blocking
+                    # one-GET-per-RTT workers measure connections x RTT, not
+                    # what the server can actually sustain
+                    for start in range(0, len(idxs), pipeline_depth):
+                        pipe = client.pipeline(transaction=False)
+                        for idx in idxs[start:start + pipeline_depth]:
+                            pipe.get(keys[idx])
+                        pipe.execute()
+                        local_ops += pipeline_depth
+                        if local_ops >= 1000:
+                            counters[client_id] += local_ops
+                            local_ops = 0
+                else:
+                    for idx in idxs:
+                        client.get(keys[idx])
+                        local_ops += 1
+                        if local_ops >= 1000:
+                            counters[client_id] += local_ops
+                            local_ops = 0
             except redis.ConnectionError as e:
                 print(f"Client {client_id} encountered connection error: {e}")
+                counters[client_id] += local_ops
                 break
 
     threads = []
-    for i in range(metrics["worker_count"]):
-        thread = threading.Thread(target=worker, args=(i, metrics, pool, keys))
+    for i in range(worker_count):
+        thread = threading.Thread(target=worker, args=(i, counters, client, keys))
         thread.daemon = True
         threads.append(thread)
         thread.start()
 
     try:
+        # Counters grow monotonically and the reporter diffs two snapshots, so
+        # increments racing a reset are never lost.
+        prev_total = 0
         while True:
             time.sleep(1)
-            with metrics["lock"]:
-                ops = metrics["ops"]
-                print(f"Throughput: {ops} ops/sec")
-                metrics["ops"] = 0
+            total = sum(counters)
+            print(f"Throughput: {total - prev_total} ops/sec")
+            prev_total = total
     except KeyboardInterrupt:
         print("Shutting down...")
         for thread in threads:
@@ -100,23 +243,31 @@ def read_db(pool, keys, metrics):
 
 def main():
     args = parse_args()
-    pool = ConnectionPool(host=args.host, port=args.port, max_connections=args.connections + args.slow_connections)
+    # Ask for the C hiredis parser explicitly so a missing hiredis install shows
+    # up as a pure-Python fallback message instead of a silent 5-10x parse slowdown
+    parser_kwargs = {'parser_class': _HiredisParser} if HIREDIS_AVAILABLE else {}
+    if not HIREDIS_AVAILABLE:
+        print("hiredis not installed; falling back to the pure-Python RESP parser")
+    pool = ConnectionPool(host=args.host, port=args.port, max_connections=args.connections + args.slow_connections,
+                          connection_class=TunedConnection, **parser_kwargs)
 
     # Stage 1: Populate DB
     if not args.skip_population:
         populate_db(pool, args.keys_count, args.data_size, args.hash_fields, args.hash_field_size)
 
-    # Stage 2: Perform Reads
-    keys = [f"key-{i}" for i in range(args.keys_count)]
-    metrics = {"ops": 0, "lock": threading.Lock(), "worker_count": args.connections}
+    # Stage 2: Perform Reads. Pre-encoded bytes keys skip the str->bytes
+    # encode inside redis-py on every GET.
+    keys = [f"key-{i}".encode() for i in range(args.keys_count)]
 
-    # Start slow connections
-    for i in range(args.slow_connections):
-        thread = threading.Thread(target=slow_reader, args=(i, args.host, args.port, args.recv_chunk_size, args.recv_sleep_time))
+    # Start slow connections; one reactor thread drives all of them
+    if args.slow_connections:
+        thread = threading.Thread(target=run_slow_readers,
+                                  args=(args.slow_connections, args.host, args.port, args.recv_chunk_size, args.recv_sleep_time,
+                                        args.so_rcvbuf, args.so_sndbuf, args.tcp_nodelay))
         thread.daemon = True
         thread.start()
 
-    read_db(pool, keys, metrics)
+    read_db(pool, keys, args.connections, args.pipeline_depth)
 
 if __name__ == "__main__":
     main()
@@ -7,17 +7,29 @@
 
 
 import redis
+import redis.asyncio as aioredis
+import asyncio
 import threading
 import time
 import argparse
 from typing import List
-import signal
 import sys
 from dataclasses import dataclass
+import array
 import random
 import logging
 import socket
 from redis.exceptions import ConnectionError, TimeoutError, RedisError
+from redis._parsers import _AsyncHiredisParser
+from redis.utils import HIREDIS_AVAILABLE
+
+# uvloop's libuv reactor batches the poll+recv work of many idle pubsub
+# sockets far better than the pure-Python selector loop; optional so the
+# script still runs where uvloop has no wheels
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
 
 # Configure logging
 logging.basicConfig(
@@ -32,11 +44,10 @@ class ConnectionStats:
     reconnection_attempts: int = 0
 
 class SlowReader:
-    def __init__(self, host: str, port: int, channel: str, 
+    def __init__(self, pool: "aioredis.ConnectionPool", channel: str,
                  min_bytes_recv: int, max_bytes_recv: int,
                  min_recv_sleep_time: float, max_recv_sleep_time: float):
-        self.host = host
-        self.port = port
+        self.pool = pool
         self.channel = channel
         self.min_bytes_recv = min_bytes_recv
         self.max_bytes_recv = max_bytes_recv
@@ -46,23 +57,37 @@ class SlowReader:
         self.running = True
         self.reconnect_delay = 1
         self.max_reconnect_delay = 30
-        self.connect()
+        # Smoothed connect-time samples for adaptive backoff: fast connects
+        # mean the path is healthy and retries can stay aggressive, slow
+        # connects mean back off harder
+        self._last_srtt = None
+        self._min_srtt = None
+        self._max_srtt = None
+        # OS-entropy RNG for backoff jitter; readers must not share Mersenne
+        # state or they re-correlate their retry times
+        self._rng = random.SystemRandom()
+        self.redis_client = None
+        self.pubsub = None
+        # Draw the per-cycle byte limits and sleep times once at startup; the
+        # hot loop then pays an array index instead of the random module's
+        # Python-level machinery on every cycle
+        self._byte_limits = array.array('i', [random.randint(min_bytes_recv, max_bytes_recv)
+                                              for _ in range(4096)])
+        self._sleep_times = array.array('d', [random.uniform(min_recv_sleep_time, max_recv_sleep_time)
+                                              for _ in range(4096)])
+        self._rand_idx = 0
 
-    def connect(self):
+    async def connect(self):
         """Establish connection to Redis and subscribe to channel"""
         try:
-            self.redis_client = redis.Redis(
-                host=self.host, 
-                port=self.port,
-                socket_keepalive=True,
-                socket_keepalive_options={
-                    socket.TCP_KEEPIDLE: 30,
-                    socket.TCP_KEEPINTVL: 5,
-                    socket.TCP_KEEPCNT: 3
-                }
-            )
-            self.pubsub = self.redis_client.pubsub()
-            self.pubsub.subscribe(self.channel)
+            start = time.monotonic()
+            self.redis_client = aioredis.Redis(connection_pool=self.pool)
+            self.pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+            await self.pubsub.subscribe(self.channel)
+            srtt = time.monotonic() - start
+            self._last_srtt = srtt
+            self._min_srtt = srtt if self._min_srtt is None else min(self._min_srtt, srtt)
+            self._max_srtt = srtt if self._max_srtt is None else max(self._max_srtt, srtt)
             self.reconnect_delay = 1
             logging.info(f"Successfully connected to Redis and subscribed to {self.channel}")
             return True
@@ -70,112 +95,176 @@ class SlowReader:
             logging.error(f"Failed to connect to Redis: {str(e)}")
             return False
 
-    def reconnect(self):
-        """Attempt to reconnect with exponential backoff"""
+    async def reconnect(self):
+        """Attempt to reconnect with jittered backoff"""
         self.stats.reconnection_attempts += 1
         logging.warning(f"Attempting to reconnect (attempt {self.stats.reconnection_attempts})")
-        
+
         while self.running:
             try:
                 # Close existing connections if any
                 try:
-                    self.pubsub.close()
-                    self.redis_client.close()
+                    if self.pubsub is not None:
+                        await self.pubsub.aclose()
+                    if self.redis_client is not None:
+                        await self.redis_client.aclose()
                 except:
                     pass
 
                 # Attempt to reconnect
-                if self.connect():
+                if await self.connect():
                     return True
-                
+
             except Exception as e:
                 logging.error(f"Reconnection attempt failed: {str(e)}")
-            
-            # Wait before next attempt with exponential backoff
-            logging.info(f"Waiting {self.reconnect_delay} seconds before next reconnection attempt")
-            time.sleep(self.reconnect_delay)
-            self.reconnect_delay = min(self.reconnect_delay * 2, self.max_reconnect_delay)
-        
+
+            # Wait before next attempt with decorrelated jitter: a uniform draw
+            # up to (1 + factor)x the previous sleep (capped) smooths out the
+            # thundering herd when all readers lose their connection at once.
+            # The adaptive factor keeps growth near x2 while connects have been
+            # fast and lets it reach x3 when the path has been degrading.
+            factor = self._backoff_factor()
+            sleep_time = self._rng.uniform(1, min(self.max_reconnect_delay, self.reconnect_delay * (1 + factor)))
+            logging.info(f"Waiting {sleep_time:.2f} seconds before next reconnection attempt")
+            await asyncio.sleep(sleep_time)
+            self.reconnect_delay = sleep_time
+
         return False
-        
+
+    def _backoff_factor(self) -> float:
+        """Adaptive backoff factor from measured connect times, clamped to [1, 2]."""
+        if self._last_srtt is None or self._max_srtt <= self._min_srtt:
+            return 1.0
+        factor = 1 + (self._last_srtt - self._min_srtt) / (self._max_srtt - self._min_srtt + 1e-9)
+        return min(2.0, max(1.0, factor))
+
     def get_random_bytes_limit(self) -> int:
         """Get random byte limit for current reading cycle"""
-        return random.randint(self.min_bytes_recv, self.max_bytes_recv)
-        
+        self._rand_idx = (self._rand_idx + 1) & 4095
+        return self._byte_limits[self._rand_idx]
+
     def get_random_sleep_time(self) -> float:
         """Get random sleep time between readings"""
-        return random.uniform(self.min_recv_sleep_time, self.max_recv_sleep_time)
+        self._rand_idx = (self._rand_idx + 1) & 4095
+        return self._sleep_times[self._rand_idx]
+
+    async def read_loop(self):
+        if not await self.connect():
+            if not await self.reconnect():
+                logging.error("Failed to connect, stopping reader")
+                return
 
-    def read_loop(self):
-        last_read_time = time.time()
+        last_read_time = time.monotonic()
         bytes_read_in_current_second = 0
         current_byte_limit = self.get_random_bytes_limit()
-        
+
         while self.running:
             try:
-                current_time = time.time()
-                if current_time - last_read_time >= 1:
-                    bytes_read_in_current_second = 0
-                    last_read_time = current_time
-                    current_byte_limit = self.get_random_bytes_limit()
-                    logging.debug(f"New byte limit: {current_byte_limit}")
-                    
-                if bytes_read_in_current_second < current_byte_limit:
-                    message = self.pubsub.get_message(timeout=1.0)
-                    if message and message['type'] == 'message':
-                        data_size = len(str(message['data']))
-                        bytes_read_in_current_second += data_size
-                        self.stats.bytes_read += data_size
-                        self.stats.messages_received += 1
-                        logging.debug(f"Received message of size {data_size}")
-                else:
-                    sleep_time = self.get_random_sleep_time()
-                    logging.debug(f"Sleeping for {sleep_time} seconds")
-                    time.sleep(sleep_time)
+                # Block on the listen() generator instead of polling
+                # get_message with a 1s timeout: the task only wakes when data
+                # arrives, and while it sleeps below, unread publishes pile up
+                # in the server-side output buffer - exactly the slow-client
+                # condition this test exists to create
+                async for message in self.pubsub.listen():
+                    if not self.running:
+                        break
+                    if message['type'] != 'message':
+                        continue
+                    # pubsub data is already bytes; str() would build a
+                    # full-payload repr per message and miscount by the
+                    # b'' wrapper
+                    data_size = len(message['data'])
+                    bytes_read_in_current_second += data_size
+                    self.stats.bytes_read += data_size
+                    self.stats.messages_received += 1
+                    # %-style args defer formatting until a DEBUG handler is
+                    # actually enabled; the f-strings built the message
+                    # string on every iteration at INFO level too
+                    logging.debug("Received message of size %d", data_size)
+
+                    # monotonic is immune to wall-clock steps and cheaper on
+                    # most platforms; one call per message serves the whole
+                    # rate window
+                    current_time = time.monotonic()
+                    if current_time - last_read_time >= 1:
+                        bytes_read_in_current_second = 0
+                        last_read_time = current_time
+                        current_byte_limit = self.get_random_bytes_limit()
+                        logging.debug("New byte limit: %d", current_byte_limit)
+                    if bytes_read_in_current_second >= current_byte_limit:
+                        sleep_time = self.get_random_sleep_time()
+                        logging.debug("Sleeping for %s seconds", sleep_time)
+                        await asyncio.sleep(sleep_time)
 
             except (ConnectionError, TimeoutError) as e:
                 if self.running:
                     logging.error(f"Connection lost: {str(e)}")
-                    if not self.reconnect():
+                    if not await self.reconnect():
                         logging.error("Failed to reconnect, stopping reader")
                         break
             except Exception as e:
                 logging.error(f"Unexpected error: {str(e)}")
                 if self.running:
-                    time.sleep(1)
+                    await asyncio.sleep(1)
 
-    def stop(self):
+    async def stop(self):
         self.running = False
         try:
-            self.pubsub.unsubscribe()
-            self.pubsub.close()
-            self.redis_client.close()
+            await self.pubsub.unsubscribe()
+            await self.pubsub.aclose()
+            await self.redis_client.aclose()
         except:
             pass
 
 class Publisher:
-    def __init__(self, host: str, port: int, channel: str, min_message_size: int, max_message_size: int):
+    def __init__(self, host: str, port: int, channel: str, min_message_size: int, max_message_size: int,
+                 publish_rate: float = 10.0):
         self.redis_client = redis.Redis(host=host, port=port)
         self.channel = channel
         self.min_message_size = min_message_size
         self.max_message_size = max_message_size
+        self.publish_rate = publish_rate
         self.running = True
         self.messages_sent = 0
         self.total_bytes_sent = 0
-        
-    def generate_message(self) -> str:
+        # The payload content is irrelevant to the test; allocate the largest
+        # message once and publish slices of it instead of building a fresh
+        # str (plus its UTF-8 encode inside redis-py) per publish
+        self._payload = b'x' * self.max_message_size
+
+    def generate_message(self) -> memoryview:
         message_size = random.randint(self.min_message_size, self.max_message_size)
-        return 'x' * message_size
+        return memoryview(self._payload)[:message_size]
         
     def publish_loop(self):
         logging.info("Publisher started")
+        batch_size = 32
+        # Pace batches against an absolute monotonic schedule instead of a
+        # fixed sleep per batch; the sleep-based loop accumulates execute()
+        # time and scheduler jitter into the effective rate
+        interval = batch_size / self.publish_rate
+        next_tick = time.monotonic()
         while self.running:
             try:
-                message = self.generate_message()
-                self.redis_client.publish(self.channel, message)
-                self.messages_sent += 1
-                self.total_bytes_sent += len(message)
-                time.sleep(0.1)  # Prevent flooding
+                now = time.monotonic()
+                if now < next_tick:
+                    time.sleep(next_tick - now)
+                elif now > next_tick + 1.0:
+                    # More than a second behind (server stall, reconnect):
+                    # resync rather than bursting to catch up
+                    next_tick = now
+                # Batch the PUBLISHes through one pipeline; a single round trip
+                # carries 32 commands instead of paying one RTT per message
+                pipe = self.redis_client.pipeline(transaction=False)
+                batch_bytes = 0
+                for _ in range(batch_size):
+                    message = self.generate_message()
+                    pipe.publish(self.channel, message)
+                    batch_bytes += len(message)
+                pipe.execute()
+                self.messages_sent += batch_size
+                self.total_bytes_sent += batch_bytes
+                next_tick += interval
             except Exception as e:
                 logging.error(f"Publisher error: {str(e)}")
                 time.sleep(1)
@@ -186,19 +275,54 @@ class Publisher:
         logging.info("Publisher stopped")
 
 class BufferTester:
-    def __init__(self, host: str, port: int, num_connections: int, 
+    def __init__(self, host: str, port: int, num_connections: int,
                  min_bytes_recv: int, max_bytes_recv: int,
                  min_recv_sleep_time: float, max_recv_sleep_time: float,
-                 min_message_size: int, max_message_size: int):
+                 min_message_size: int, max_message_size: int,
+                 shared_socket: bool = False, publish_rate: float = 10.0):
         self.channel = "test_channel"
         self.slow_readers: List[SlowReader] = []
-        self.reader_threads: List[threading.Thread] = []
-        
-        # Create slow readers
-        for i in range(num_connections):
+        self.reader_tasks: List[asyncio.Task] = []
+
+        # Ask for the C hiredis parser explicitly so a missing hiredis install
+        # shows up as a log line instead of a silent multi-x parse slowdown on
+        # the message hot path
+        parser_kwargs = {'parser_class': _AsyncHiredisParser} if HIREDIS_AVAILABLE else {}
+        if not HIREDIS_AVAILABLE:
+            logging.warning("hiredis not installed; falling back to the pure-Python RESP parser")
+
+        # One shared pool for every reader: the host is resolved once and the
+        # keepalive options live in one place instead of per-client kwargs
+        self.pool = aioredis.ConnectionPool(
+            host=host,
+            port=port,
+            max_connections=num_connections + 4,
+            **parser_kwargs,
+            socket_keepalive=True,
+            socket_keepalive_options={
+                socket.TCP_KEEPIDLE: 30,
+                socket.TCP_KEEPINTVL: 5,
+                socket.TCP_KEEPCNT: 3
+            }
+        )
+
+        # Shared-socket mode: the channel delivers every publish to a
+        # subscriber exactly once, so one reader sleeping N times longer per
+        # cycle exerts the same server-side output-buffer pressure as N slow
+        # readers — with 1/N file descriptors and kernel TCP buffers, and
+        # without tripping the per-socket rmem_max cap N separate ways
+        if shared_socket:
+            reader_count = 1
+            min_recv_sleep_time *= num_connections
+            max_recv_sleep_time *= num_connections
+        else:
+            reader_count = num_connections
+
+        # Create slow readers; they all run as coroutines on one event loop
+        # instead of one OS thread each, so the count can go into the thousands
+        for i in range(reader_count):
             reader = SlowReader(
-                host=host,
-                port=port,
+                pool=self.pool,
                 channel=self.channel,
                 min_bytes_recv=min_bytes_recv,
                 max_bytes_recv=max_bytes_recv,
@@ -206,41 +330,45 @@ class BufferTester:
                 max_recv_sleep_time=max_recv_sleep_time
             )
             self.slow_readers.append(reader)
-            thread = threading.Thread(
-                target=reader.read_loop,
-                name=f"SlowReader-{i+1}"
-            )
-            self.reader_threads.append(thread)
-            
+
         # Create publisher
-        self.publisher = Publisher(host, port, self.channel, min_message_size, max_message_size)
+        self.publisher = Publisher(host, port, self.channel, min_message_size, max_message_size, publish_rate)
         self.publisher_thread = threading.Thread(
             target=self.publisher.publish_loop,
             name="Publisher"
         )
 
-    def start(self):
+    async def run(self, duration):
         logging.info("Starting test...")
         # Start readers
-        for thread in self.reader_threads:
-            thread.start()
-            
+        self.reader_tasks = [
+            asyncio.create_task(reader.read_loop(), name=f"SlowReader-{i+1}")
+            for i, reader in enumerate(self.slow_readers)
+        ]
+
         # Start publisher
         self.publisher_thread.start()
-        logging.info("All threads started")
-        
-    def stop(self):
+        logging.info("All readers started")
+
+        try:
+            await asyncio.sleep(duration)
+        finally:
+            await self.stop()
+
+    async def stop(self):
         logging.info("Stopping test...")
         # Stop publisher first
         self.publisher.stop()
         self.publisher_thread.join()
-        
+
         # Then stop readers
         for reader in self.slow_readers:
-            reader.stop()
-        for thread in self.reader_threads:
-            thread.join()
-        logging.info("All threads stopped")
+            await reader.stop()
+        for task in self.reader_tasks:
+            task.cancel()
+        await asyncio.gather(*self.reader_tasks, return_exceptions=True)
+        await self.pool.aclose()
+        logging.info("All readers stopped")
             
     def print_stats(self):
         total_bytes_read = sum(reader.stats.bytes_read for reader in self.slow_readers)
@@ -285,6 +413,11 @@ def main():
                         help='Maximum size of published messages in bytes')
     parser.add_argument('--duration', type=int, default=60,
                         help='Test duration in seconds')
+    parser.add_argument('--publish-rate', type=float, default=10.0,
+                        help='Target publish rate in messages per second')
+    parser.add_argument('--shared-socket', action='store_true',
+                        help='Model all slow readers on one subscriber socket '
+                             '(sleep times scaled by the connection count)')
     
     args = parser.parse_args()
     
@@ -320,28 +453,30 @@ def main():
         min_recv_sleep_time=args.min_recv_sleep_time,
         max_recv_sleep_time=args.max_recv_sleep_time,
         min_message_size=args.min_message_size,
-        max_message_size=args.max_message_size
+        max_message_size=args.max_message_size,
+        shared_socket=args.shared_socket,
+        publish_rate=args.publish_rate
     )
     
-    def signal_handler(signum, frame):
-        print("\nStopping test...")
-        tester.stop()
-        tester.print_stats()
-        sys.exit(0)
-        
-    signal.signal(signal.SIGINT, signal_handler)
-    
     print(f"Starting test with:")
-    print(f"- {args.connections} connections")
+    if args.shared_socket:
+        print(f"- 1 shared socket modeling {args.connections} slow connections")
+    else:
+        print(f"- {args.connections} connections")
     print(f"- Receive rate: {args.min_bytes_recv} - {args.max_bytes_recv} bytes/second per connection")
     print(f"- Receive sleep time: {args.min_recv_sleep_time} - {args.max_recv_sleep_time} seconds")
     print(f"- Message size range: {args.min_message_size} - {args.max_message_size} bytes")
     print(f"- {args.duration} seconds duration")
     print("\nPress Ctrl+C to stop the test early...")
-    
-    tester.start()
-    time.sleep(args.duration)
-    tester.stop()
+
+    if uvloop is not None:
+        uvloop.install()
+    else:
+        logging.info("uvloop not installed; using the default asyncio event loop")
+    try:
+        asyncio.run(tester.run(args.duration))
+    except KeyboardInterrupt:
+        print("\nStopping test...")
     tester.print_stats()
 
 if __name__ == "__main__":
@@ -33,6 +33,9 @@ class SlowReader:
         self.running = True
         self.reconnect_delay = 1
         self.max_reconnect_delay = 30
+        # OS-entropy RNG for backoff jitter; readers must not share Mersenne
+        # state across threads or they re-correlate their retry times
+        self._rng = random.SystemRandom()
         self.connect()
 
     def connect(self):
@@ -78,20 +81,25 @@ class SlowReader:
             except Exception as e:
                 logging.error(f"Reconnection attempt failed: {str(e)}")
 
-            # Wait before next attempt with exponential backoff
-            logging.info(f"Waiting {self.reconnect_delay} seconds before next reconnection attempt")
-            time.sleep(self.reconnect_delay)
-            self.reconnect_delay = min(self.reconnect_delay * 2, self.max_reconnect_delay)
+            # Wait before next attempt with decorrelated jitter: a uniform draw
+            # up to 3x the previous sleep (capped) smooths out the thundering
+            # herd when all readers lose their connection at once
+            sleep_time = self._rng.uniform(1, min(self.max_reconnect_delay, self.reconnect_delay * 3))
+            logging.info(f"Waiting {sleep_time:.2f} seconds before next reconnection attempt")
+            time.sleep(sleep_time)
+            self.reconnect_delay = sleep_time
 
         return False
 
     def read_loop(self):
-        last_read_time = time.time()
+        last_read_time = time.monotonic()
         bytes_read_in_current_second = 0
 
         while self.running:
             try:
-                current_time = time.time()
+                # monotonic is immune to wall-clock steps and cheaper on most
+                # platforms; one call per iteration serves the whole rate window
+                current_time = time.monotonic()
                 if current_time - last_read_time >= 1:
                     bytes_read_in_current_second = 0
                     last_read_time = current_time
@@ -99,7 +107,10 @@ class SlowReader:
                 if bytes_read_in_current_second < self.bytes_per_second:
                     message = self.pubsub.get_message(timeout=1.0)
                     if message and message['type'] == 'message':
-                        data_size = len(str(message['data']))
+                        # pubsub data is already bytes; str() would build a
+                        # full-payload repr per message and miscount by the
+                        # b'' wrapper
+                        data_size = len(message['data'])
                         bytes_read_in_current_second += data_size
                         self.stats.bytes_read += data_size
                         self.stats.messages_received += 1